@@ -2,8 +2,7 @@ import torch
 import yaml
 import os
 
-global path_idx, maze_path
-path_idx = None
+global maze_path
 maze_path = None
 
 
@@ -20,7 +20,11 @@ from omni.isaac.orbit.managers import TerminationTermCfg as DoneTerm
 from omni.isaac.orbit.scene import InteractiveSceneCfg
 from omni.isaac.orbit.actuators import ImplicitActuatorCfg
 from omni.isaac.orbit.utils import configclass
-from globals import path_idx, maze_path
+import globals
+
+# load the maze path on demand so that importing this module does not depend on the caller's import order
+if globals.maze_path is None:
+    globals.init_globals()
 
 import orbit.maze.tasks.maze.mdp as mdp
 import os
@@ -48,8 +52,7 @@ MAZE_CFG = ArticulationCfg(
         ),
         articulation_props=sim_utils.ArticulationRootPropertiesCfg(
             enabled_self_collisions=False,
-            solver_position_iteration_count=4,
-            solver_velocity_iteration_count=0,
+            # solver iteration counts are set from MazeEnvCfg.pos_iters / vel_iters
             sleep_threshold=0.005,
             stabilization_threshold=0.001,
         ),
@@ -58,15 +61,8 @@ MAZE_CFG = ArticulationCfg(
         pos=(0.0, 0.0, 0.0), joint_pos={"OuterDOF_RevoluteJoint": 0.0, "InnerDOF_RevoluteJoint": 0.0}
     ),
     actuators={
-        "outer_actuator": ImplicitActuatorCfg(
-            joint_names_expr=["OuterDOF_RevoluteJoint"],
-            effort_limit=0.1,  # 5g * 9.81 * 0.15m = 0.007357
-            velocity_limit=1.0 / math.pi,
-            stiffness=1000.0,
-            damping=0.0,
-        ),
-        "inner_actuator": ImplicitActuatorCfg(
-            joint_names_expr=["InnerDOF_RevoluteJoint"],
+        "revolute_joints": ImplicitActuatorCfg(
+            joint_names_expr=["OuterDOF_RevoluteJoint", "InnerDOF_RevoluteJoint"],
             effort_limit=0.1,  # 5g * 9.81 * 0.15m = 0.007357
             velocity_limit=1.0 / math.pi,
             stiffness=1000.0,
@@ -102,7 +98,7 @@ class MazeSceneCfg(InteractiveSceneCfg):
             collision_props=sim_utils.CollisionPropertiesCfg(collision_enabled=True),
             visual_material=sim_utils.PreviewSurfaceCfg(diffuse_color=(0.9, 0.9, 0.9), metallic=0.8),
         ),
-        init_state=RigidObjectCfg.InitialStateCfg(pos=(maze_path[0, 0], maze_path[0, 1], 0.12)),
+        init_state=RigidObjectCfg.InitialStateCfg(pos=(globals.maze_path[0, 0], globals.maze_path[0, 1], 0.12)),
     )
 
     target1 = RigidObjectCfg(
@@ -113,7 +109,7 @@ class MazeSceneCfg(InteractiveSceneCfg):
             collision_props=sim_utils.CollisionPropertiesCfg(collision_enabled=False),
             visual_material=sim_utils.PreviewSurfaceCfg(diffuse_color=(1.0, 0.0, 0.0), metallic=0.2),
         ),
-        init_state=RigidObjectCfg.InitialStateCfg(pos=(maze_path[0, 0], maze_path[0, 1], 0.105)),
+        init_state=RigidObjectCfg.InitialStateCfg(pos=(globals.maze_path[0, 0], globals.maze_path[0, 1], 0.105)),
     )
     target2 = RigidObjectCfg(
         prim_path="{ENV_REGEX_NS}/target2",
@@ -123,7 +119,7 @@ class MazeSceneCfg(InteractiveSceneCfg):
             collision_props=sim_utils.CollisionPropertiesCfg(collision_enabled=False),
             visual_material=sim_utils.PreviewSurfaceCfg(diffuse_color=(0.0, 1.0, 0.0), metallic=0.2),
         ),
-        init_state=RigidObjectCfg.InitialStateCfg(pos=(maze_path[1, 0], maze_path[1, 1], 0.105)),
+        init_state=RigidObjectCfg.InitialStateCfg(pos=(globals.maze_path[1, 0], globals.maze_path[1, 1], 0.105)),
     )
     target3 = RigidObjectCfg(
         prim_path="{ENV_REGEX_NS}/target3",
@@ -133,7 +129,7 @@ class MazeSceneCfg(InteractiveSceneCfg):
             collision_props=sim_utils.CollisionPropertiesCfg(collision_enabled=False),
             visual_material=sim_utils.PreviewSurfaceCfg(diffuse_color=(0.0, 0.0, 1.0), metallic=0.2),
         ),
-        init_state=RigidObjectCfg.InitialStateCfg(pos=(maze_path[2, 0], maze_path[2, 1], 0.105)),
+        init_state=RigidObjectCfg.InitialStateCfg(pos=(globals.maze_path[2, 0], globals.maze_path[2, 1], 0.105)),
     )
 
     dome_light = AssetBaseCfg(
@@ -163,7 +159,7 @@ class ActionsCfg:
     inner_joint_effort = mdp.JointPositionActionCfg(asset_name="robot", joint_names=["InnerDOF_RevoluteJoint"], scale=1)
 
 
-velocity_extractor = mdp.VelocityExtractor()
+policy_observation = mdp.PolicyObservation()
 
 
 @configclass
@@ -174,37 +170,16 @@ class ObservationsCfg:
     class PolicyCfg(ObsGroup):
         """Observations for policy group."""
 
-        # observation terms (order preserved)
-        joint_pos = ObsTerm(func=mdp.joint_pos)
-        # joint_vel = ObsTerm(func=mdp.joint_vel)
-        joint_est_vel = ObsTerm(
-            func=velocity_extractor.extract_joint_velocity,
-            params={"asset_cfg": SceneEntityCfg("robot")},
-        )
-        sphere_pos = ObsTerm(
-            func=mdp.root_pos_w,
-            params={"asset_cfg": SceneEntityCfg("sphere")},
-        )
-        sphere_est_vel = ObsTerm(
-            func=velocity_extractor.extract_root_velocity,
-            params={"asset_cfg": SceneEntityCfg("sphere")},
-        )
-        target1_pos = ObsTerm(
-            func=mdp.root_pos_w_xy,
-            params={
-                "asset_cfg": SceneEntityCfg("target1"),
-            },
-        )
-        target2_pos = ObsTerm(
-            func=mdp.root_pos_w_xy,
-            params={
-                "asset_cfg": SceneEntityCfg("target2"),
-            },
-        )
-        target3_pos = ObsTerm(
-            func=mdp.root_pos_w_xy,
+        # joint positions, estimated joint velocities, sphere position, estimated sphere velocity
+        # and the xy-positions of the three targets, written into a single buffer
+        policy_obs = ObsTerm(
+            func=policy_observation.compute,
             params={
-                "asset_cfg": SceneEntityCfg("target3"),
+                "robot_cfg": SceneEntityCfg("robot"),
+                "sphere_cfg": SceneEntityCfg("sphere"),
+                "target1_cfg": SceneEntityCfg("target1"),
+                "target2_cfg": SceneEntityCfg("target2"),
+                "target3_cfg": SceneEntityCfg("target3"),
             },
         )
 
@@ -360,14 +335,23 @@ class MazeEnvCfg(RLTaskEnvCfg):
     terminations: TerminationsCfg = TerminationsCfg()
     # No command generator
     commands: CommandsCfg = CommandsCfg()
+    # Physics rate and number of physics steps per policy step
+    sim_hz: int = 200
+    control_decimation: int = 4
+    # Solver iterations of the maze articulation
+    pos_iters: int = 4
+    vel_iters: int = 0
 
     # Post initialization
     def __post_init__(self) -> None:
         """Post initialization."""
         # general settings
-        self.decimation = 2
+        self.decimation = self.control_decimation
         self.episode_length_s = 30
         # viewer settings
         self.viewer.eye = (1, 1, 1.5)
         # simulation settings
-        self.sim.dt = 1 / 200
+        self.sim.dt = 1 / self.sim_hz
+        # physics solver settings
+        self.scene.robot.spawn.articulation_props.solver_position_iteration_count = self.pos_iters
+        self.scene.robot.spawn.articulation_props.solver_velocity_iteration_count = self.vel_iters
@@ -74,6 +74,47 @@ class VelocityExtractor:
         return current_joint_vel
 
 
+class PolicyObservation:
+    """Policy observations assembled into a single preallocated buffer.
+
+    The layout matches the concatenation of the joint positions, the estimated joint velocities, the sphere
+    position, the estimated sphere velocity and the xy-positions of the three targets.
+    """
+
+    def __init__(self):
+        self.velocity_extractor = VelocityExtractor()
+        self._obs_buf = None
+
+    def compute(
+        self,
+        env: RLTaskEnv,
+        robot_cfg: SceneEntityCfg,
+        sphere_cfg: SceneEntityCfg,
+        target1_cfg: SceneEntityCfg,
+        target2_cfg: SceneEntityCfg,
+        target3_cfg: SceneEntityCfg,
+    ) -> torch.Tensor:
+        """Fill the observation buffer in-place and return it."""
+        robot: Articulation = env.scene[robot_cfg.name]
+        sphere: RigidObject = env.scene[sphere_cfg.name]
+        terms = (
+            robot.data.joint_pos[:, robot_cfg.joint_ids],
+            self.velocity_extractor.extract_joint_velocity(env, robot_cfg),
+            sphere.data.root_pos_w - env.scene.env_origins,
+            self.velocity_extractor.extract_root_velocity(env, sphere_cfg),
+            root_pos_w_xy(env, target1_cfg),
+            root_pos_w_xy(env, target2_cfg),
+            root_pos_w_xy(env, target3_cfg),
+        )
+
+        if self._obs_buf is None:
+            self._obs_buf = torch.cat(terms, dim=-1)
+        else:
+            # a single concatenation kernel into the existing buffer
+            torch.cat(terms, dim=-1, out=self._obs_buf)
+        return self._obs_buf
+
+
 def camera_image(env: RLTaskEnv, asset_cfg: SceneEntityCfg) -> torch.Tensor:
     """Camera image from top camera."""
     # extract the used quantities (to enable type-hinting)
@@ -5,6 +5,7 @@
 
 from __future__ import annotations
 
+import functools
 import torch
 from typing import TYPE_CHECKING
 
@@ -13,12 +14,80 @@ from omni.isaac.orbit.managers import SceneEntityCfg
 from omni.isaac.orbit.utils.math import wrap_to_pi
 import omni.isaac.orbit.utils.math as math_utils
 from omni.isaac.orbit.utils import configclass
-from globals import path_idx, maze_path
+import globals
 
 if TYPE_CHECKING:
     from omni.isaac.orbit.envs import RLTaskEnv
 
 
+def _env_origins_xy(env: RLTaskEnv) -> torch.Tensor:
+    """Contiguous xy-origins of the environments, sliced once since they are static per run."""
+    if not hasattr(env, "_env_origins_xy"):
+        env._env_origins_xy = env.scene.env_origins[:, :2].contiguous()
+    return env._env_origins_xy
+
+
+def _root_pos_xy(env: RLTaskEnv, asset: RigidObject | Articulation) -> torch.Tensor:
+    """Asset root xy-position in the environment frame, computed at most once per step.
+
+    The positions are cached on the environment, keyed by asset. The returned tensor is shared between all
+    reward terms of the same step and must not be modified in-place.
+    """
+    if not hasattr(env, "_root_pos_xy_cache"):
+        env._root_pos_xy_cache = {}
+    key = id(asset)
+    cached = env._root_pos_xy_cache.get(key)
+    if cached is not None and cached[0] == env.common_step_counter:
+        return cached[1]
+    root_pos_xy = asset.data.root_pos_w[:, :2] - _env_origins_xy(env)
+    env._root_pos_xy_cache[key] = (env.common_step_counter, root_pos_xy)
+    return root_pos_xy
+
+
+@functools.lru_cache(maxsize=64)
+def _dict_target_to_tensor(x: float, y: float, device: torch.device | str) -> torch.Tensor:
+    """Constant xy-target of shape (1, 2), created once per value and device.
+
+    The returned tensor is shared between calls and must not be modified in-place.
+    """
+    return torch.tensor([[x, y]], device=device)
+
+
+def _pose_range_tensor(
+    env: RLTaskEnv, pose_range: dict[str, tuple[float, float]], device: torch.device | str
+) -> torch.Tensor:
+    """Sampling ranges of shape (3, 2) for the xyz-position, created once per pose range config."""
+    if not hasattr(env, "_pose_range_cache"):
+        env._pose_range_cache = {}
+    ranges = env._pose_range_cache.get(id(pose_range))
+    if ranges is None:
+        range_list = [pose_range.get(key, (0.0, 0.0)) for key in ["x", "y", "z"]]
+        ranges = torch.tensor(range_list, device=device)
+        env._pose_range_cache[id(pose_range)] = ranges
+    return ranges
+
+
+def _get_path_state(env: RLTaskEnv, device: torch.device | str) -> tuple[torch.Tensor, torch.Tensor]:
+    """Maze path points and per-env path index, stored on the environment on first access."""
+    if not hasattr(env, "_maze_path"):
+        env._maze_path = globals.maze_path.to(device)
+        env._path_idx = torch.full((env.num_envs,), 2, device=device, dtype=torch.long)
+    return env._maze_path, env._path_idx
+
+
+def _shift_target_poses(
+    env: RLTaskEnv, targets: tuple[RigidObject, ...], last_pose: torch.Tensor, env_ids: torch.Tensor
+):
+    """Move each target to the pose of its successor and the last target to ``last_pose``."""
+    # gather all poses before writing, since each target takes over the pose of its successor
+    poses = [target.data.root_state_w[env_ids, :7] for target in targets[1:]] + [last_pose]
+    for target, pose in zip(targets, poses):
+        target.write_root_pose_to_sim(pose, env_ids=env_ids)
+        # the cached position of the target is outdated now
+        if hasattr(env, "_root_pos_xy_cache"):
+            env._root_pos_xy_cache.pop(id(target), None)
+
+
 def path_point_target(
     env: RLTaskEnv,
     target1_cfg: SceneEntityCfg,
@@ -34,55 +103,40 @@ def path_point_target(
     target1: RigidObject = env.scene[target1_cfg.name]
     target2: RigidObject = env.scene[target2_cfg.name]
     target3: RigidObject = env.scene[target3_cfg.name]
-    sphere_pos = sphere.data.root_pos_w - env.scene.env_origins
-    target1_pos = target1.data.root_pos_w - env.scene.env_origins
-
-    global path_idx
-    global maze_path
+    sphere_pos = _root_pos_xy(env, sphere)
+    target1_pos = _root_pos_xy(env, target1)
 
-    if path_idx is None:
-        path_idx = 2 * torch.ones(env.num_envs, device=sphere.device, dtype=int)
-        maze_path = maze_path.to(sphere.device)
-        path_idx = path_idx.to(sphere.device)
+    maze_path, path_idx = _get_path_state(env, sphere.device)
 
-    xy_sparse_reward = torch.norm(sphere_pos[:, :2] - target1_pos[:, :2], dim=1) < distance_from_target
-    target_reached_ids = torch.nonzero(xy_sparse_reward).view(-1)
+    # compare squared distances to avoid the square root
+    diff = sphere_pos - target1_pos
+    xy_sparse_reward = (diff * diff).sum(-1) < distance_from_target * distance_from_target
+    target_reached_ids = torch.nonzero(xy_sparse_reward, as_tuple=True)[0]
+    # skip the pose writes to the simulation if no target was reached
     if target_reached_ids.numel() == 0:
-        return xy_sparse_reward
+        return xy_sparse_reward.float()
 
-    target2to1 = target2.data.root_state_w[target_reached_ids, :7].clone().squeeze(0)
-    target3to2 = target3.data.root_state_w[target_reached_ids, :7].clone().squeeze(0)
-    targetNextto3 = target3.data.root_state_w[target_reached_ids, :7].clone().squeeze(0)
-
-    if targetNextto3.dim() == 1:
-        targetNextto3 = targetNextto3.unsqueeze(0)
+    # advanced indexing already gathers into a new (K, 7) tensor, so it can be modified without a clone
+    targetNextto3 = target3.data.root_state_w[target_reached_ids, :7]
 
     # update the path index and last target
     path_idx[target_reached_ids] += 1
-    path_idx[path_idx >= idx_max] = idx_max
+    path_idx.clamp_(max=idx_max)
 
-    updated_path_idx = torch.tensor(path_idx[target_reached_ids], device=sphere.device, dtype=int)
-    targetNext = maze_path[updated_path_idx, :]
-    targetNextto3[:, :2] = targetNext + env.scene.env_origins[target_reached_ids, :2]
+    targetNext = maze_path[path_idx[target_reached_ids], :]
+    targetNextto3[:, :2] = targetNext + _env_origins_xy(env)[target_reached_ids]
 
-    target1.write_root_pose_to_sim(target2to1, env_ids=target_reached_ids)
-    target2.write_root_pose_to_sim(target3to2, env_ids=target_reached_ids)
-    target3.write_root_pose_to_sim(targetNextto3, env_ids=target_reached_ids)
-    return xy_sparse_reward
+    _shift_target_poses(env, (target1, target2, target3), targetNextto3, target_reached_ids)
+    return xy_sparse_reward.float()
 
 
 def reset_maze_path_idx(env: BaseEnv, env_ids: torch.Tensor, sphere_cfg: SceneEntityCfg):
     sphere: RigidObject = env.scene[sphere_cfg.name]
 
-    global path_idx
-    global maze_path
-    if path_idx is None:
-        path_idx = 2 * torch.ones(env.num_envs, device=sphere.device, dtype=int)
-        maze_path = maze_path.to(sphere.device)
-        path_idx = path_idx.to(sphere.device)
+    _, path_idx = _get_path_state(env, sphere.device)
 
-    path_idx[env_ids] = 2 * torch.ones(len(env_ids), device=sphere.device, dtype=int)
-    path_idx = path_idx.clone().to(sphere.device)
+    # reset in-place so the cached tensor is never re-bound
+    path_idx.index_fill_(0, env_ids.to(path_idx.device, dtype=torch.long), 2)
 
 
 def root_xypos_target(
@@ -93,14 +147,19 @@ def root_xypos_target(
     asset: RigidObject = env.scene[asset_cfg.name]
     if isinstance(target_cfg, SceneEntityCfg):
         target: RigidObject = env.scene[target_cfg.name]
-        target_pos = target.data.root_pos_w - env.scene.env_origins
+        target_pos = _root_pos_xy(env, target)
     else:
-        target_pos = torch.tensor([target.get(key, 0.0) for key in ["x", "y"]], device=asset.data.root_pos_w.device)
+        target_pos = _dict_target_to_tensor(target_cfg.get("x", 0.0), target_cfg.get("y", 0.0), asset.device)
 
-    root_pos = asset.data.root_pos_w - env.scene.env_origins
+    root_pos = _root_pos_xy(env, asset)
     # compute the reward
-    xy_reward_l2 = torch.norm(root_pos[:, :2] - target_pos[:, :2], p=LNorm, dim=1)
-    return xy_reward_l2
+    diff = root_pos - target_pos
+    if LNorm == 2:
+        return diff.square().sum(-1).sqrt_()
+    elif LNorm == 1:
+        return diff.abs().sum(-1)
+    else:
+        return torch.linalg.vector_norm(diff, ord=LNorm, dim=1)
 
 
 def spline_point_target(
@@ -119,27 +178,22 @@ def spline_point_target(
     target1: RigidObject = env.scene[target1_cfg.name]
     target2: RigidObject = env.scene[target2_cfg.name]
     target3: RigidObject = env.scene[target3_cfg.name]
-    sphere_pos = sphere.data.root_pos_w - env.scene.env_origins
-    target1_pos = target1.data.root_pos_w - env.scene.env_origins
+    sphere_pos = _root_pos_xy(env, sphere)
+    target1_pos = _root_pos_xy(env, target1)
 
-    xy_sparse_reward = torch.norm(sphere_pos[:, :2] - target1_pos[:, :2], dim=1) < distance_from_target
+    # compare squared distances to avoid the square root
+    diff = sphere_pos - target1_pos
+    xy_sparse_reward = (diff * diff).sum(-1) < distance_from_target * distance_from_target
     target_reached_ids = torch.nonzero(xy_sparse_reward).view(-1)
     if target_reached_ids.numel() == 0:
-        return xy_sparse_reward
+        return xy_sparse_reward.float()
 
     # resample the target pose for the reached ids
     range_size = (len(target_reached_ids), 3)
-    range_list = [pose_range.get(key, (0.0, 0.0)) for key in ["x", "y", "z"]]
-    ranges = torch.tensor(range_list, device=sphere.device)
+    ranges = _pose_range_tensor(env, pose_range, sphere.device)
 
     rand_samples = math_utils.sample_uniform(ranges[:, 0], ranges[:, 1], range_size, device=sphere.device)
 
-    target2to1 = target2.data.root_state_w[target_reached_ids, :7].clone().squeeze(0)
-    target3to2 = target3.data.root_state_w[target_reached_ids, :7].clone().squeeze(0)
-
-    target1.write_root_pose_to_sim(target2to1, env_ids=target_reached_ids)
-    target2.write_root_pose_to_sim(target3to2, env_ids=target_reached_ids)
-
     # sample new position
     new_pos = (
         target3.data.default_root_state[target_reached_ids, :3]
@@ -149,9 +203,9 @@ def spline_point_target(
     # orientation
     new_ori = target3.data.default_root_state[target_reached_ids, 3:7]
 
-    target3.write_root_pose_to_sim(torch.cat([new_pos, new_ori], dim=-1), env_ids=target_reached_ids)
+    _shift_target_poses(env, (target1, target2, target3), torch.cat([new_pos, new_ori], dim=-1), target_reached_ids)
 
-    return xy_sparse_reward
+    return xy_sparse_reward.float()
 
 
 def root_xy_sparse_target(
@@ -165,22 +219,21 @@ def root_xy_sparse_target(
     # extract the used quantities (to enable type-hinting)
     sphere: RigidObject = env.scene[sphere_cfg.name]
 
-    global path_idx
+    _, path_idx = _get_path_state(env, sphere.device)
 
     if isinstance(target_cfg, SceneEntityCfg):
         target: RigidObject = env.scene[target_cfg.name]
-        target_pos = target.data.root_pos_w - env.scene.env_origins
+        target_pos = _root_pos_xy(env, target)
     else:
-        target_pos = torch.tensor(
-            [target_cfg.get(key, 0.0) for key in ["x", "y"]], device=sphere.data.root_pos_w.device
-        )
-        target_pos = target_pos.unsqueeze(0)
+        target_pos = _dict_target_to_tensor(target_cfg.get("x", 0.0), target_cfg.get("y", 0.0), sphere.device)
 
-    root_pos = sphere.data.root_pos_w - env.scene.env_origins
+    root_pos = _root_pos_xy(env, sphere)
     # compute the reward
-    xy_sparse_reward = torch.norm(root_pos[:, :2] - target_pos[:, :2], dim=1) < distance_from_target
+    diff = root_pos - target_pos
+    xy_sparse_reward = (diff * diff).sum(-1) < distance_from_target * distance_from_target
 
-    reached_goal = idx * torch.ones_like(path_idx) == path_idx
-    xy_sparse_reward = xy_sparse_reward * reached_goal
+    reached_goal = path_idx.eq(idx)
+    # both masks are freshly computed bool tensors, so combine them in-place
+    xy_sparse_reward.logical_and_(reached_goal)
 
     return xy_sparse_reward
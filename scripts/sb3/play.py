@@ -19,6 +19,12 @@ parser.add_argument(
 )
 parser.add_argument("--num_envs", type=int, default=4, help="Number of environments to simulate.")
 parser.add_argument("--task", type=str, default="Isaac-Maze-v0", help="Name of the task.")
+parser.add_argument(
+    "--gpu_tensors",
+    action="store_true",
+    default=False,
+    help="Pass observations and actions between the environment and the policy as tensors on the device.",
+)
 # parser.add_argument("--livestream", type=int, default="1", help="stream remotely")
 parser.add_argument(
     "--checkpoint",
@@ -43,7 +49,6 @@ simulation_app = app_launcher.app
 """Rest everything follows."""
 
 import gymnasium as gym
-import numpy as np
 import os
 import torch
 
@@ -59,6 +64,9 @@ globals.init_globals()
 
 import orbit.maze
 
+# local imports
+from sb3_utils import GPUPPO, GPUVecNormalize, TorchVecEnvWrapper, build_vecnormalize  # isort: skip
+
 
 def main():
     """Play with stable-baselines agent."""
@@ -73,19 +81,18 @@ def main():
     # create isaac environment
     env = gym.make(args_cli.task, cfg=env_cfg)
     # wrap around environment for stable baselines
-    env = Sb3VecEnvWrapper(env)
+    if args_cli.gpu_tensors:
+        # skip the round trip of the observations and actions through the host
+        env = TorchVecEnvWrapper(env)
+        agent_class = GPUPPO
+        vec_normalize_class = GPUVecNormalize
+    else:
+        env = Sb3VecEnvWrapper(env)
+        agent_class = PPO
+        vec_normalize_class = VecNormalize
 
     # normalize environment (if needed)
-    if "normalize_input" in agent_cfg:
-        env = VecNormalize(
-            env,
-            training=True,
-            norm_obs="normalize_input" in agent_cfg and agent_cfg.pop("normalize_input"),
-            norm_reward="normalize_value" in agent_cfg and agent_cfg.pop("normalize_value"),
-            clip_obs="clip_obs" in agent_cfg and agent_cfg.pop("clip_obs"),
-            gamma=agent_cfg["gamma"],
-            clip_reward=np.inf,
-        )
+    env = build_vecnormalize(env, agent_cfg, vec_normalize_class)
 
     # directory for logging into
     log_root_path = os.path.join("logs", "sb3", args_cli.task)
@@ -101,7 +108,7 @@ def main():
         checkpoint_path = args_cli.checkpoint
     # create agent from stable baselines
     print(f"Loading checkpoint from: {checkpoint_path}")
-    agent = PPO.load(checkpoint_path, env, print_system_info=True)
+    agent = agent_class.load(checkpoint_path, env, print_system_info=True)
 
     # reset environment
     obs = env.reset()
@@ -110,7 +117,10 @@ def main():
         # run everything in inference mode
         with torch.inference_mode():
             # agent stepping
-            actions, _ = agent.predict(obs, deterministic=True)
+            if args_cli.gpu_tensors:
+                actions = agent.predict_tensor(obs, deterministic=True)
+            else:
+                actions, _ = agent.predict(obs, deterministic=True)
             # env stepping
             obs, _, _, _ = env.step(actions)
 
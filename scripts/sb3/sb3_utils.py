@@ -0,0 +1,1160 @@
+# Copyright (c) 2022-2024, The ORBIT Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Helpers to keep the Stable-Baselines3 training loop on the simulation device.
+
+Stable-Baselines3 moves observations, rewards and dones through NumPy on every step and stores the rollouts
+in NumPy arrays, which are copied back to the device for every minibatch. The classes in this module keep
+all of these as tensors on the device instead.
+"""
+
+from __future__ import annotations
+
+import gymnasium as gym
+import numpy as np
+import os
+import pickle
+import tempfile
+import torch
+import warnings
+import zipfile
+from collections.abc import Callable, Generator
+from concurrent.futures import Future, ThreadPoolExecutor
+from fractions import Fraction
+from gymnasium import spaces
+from torch.nn import functional as F
+
+import stable_baselines3 as sb3
+from stable_baselines3 import PPO
+from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.callbacks import BaseCallback, CheckpointCallback
+from stable_baselines3.common.running_mean_std import RunningMeanStd
+from stable_baselines3.common.save_util import data_to_json, json_to_data, recursive_getattr, recursive_setattr
+from stable_baselines3.common.type_aliases import RolloutBufferSamples
+from stable_baselines3.common.utils import check_for_correct_spaces, get_device, get_system_info
+from stable_baselines3.common.vec_env import VecEnv, VecNormalize
+from stable_baselines3.common.vec_env.patch_gym import _convert_space
+
+from omni.isaac.orbit_tasks.utils.wrappers.sb3 import Sb3VecEnvWrapper
+
+
+def _write_output(out: torch.Tensor | None, tensor: torch.Tensor) -> torch.Tensor:
+    """Copy a step output into the provided tensor and return it, or return the output itself if there is none."""
+    if out is None:
+        return tensor
+    out.copy_(tensor.reshape(out.shape))
+    return out
+
+
+class TorchVecEnvWrapper(Sb3VecEnvWrapper):
+    """Stable-Baselines3 wrapper that returns observations, rewards and dones as tensors on the sim device.
+
+    With :meth:`set_output_buffer`, the outputs of the next step are written directly into caller-owned
+    tensors, e.g. the slots of a rollout buffer, instead of being copied there by the caller.
+    """
+
+    _output_buffers: tuple[torch.Tensor | None, ...] = (None, None, None)
+
+    def set_output_buffer(
+        self,
+        obs_out: torch.Tensor | None = None,
+        rew_out: torch.Tensor | None = None,
+        done_out: torch.Tensor | None = None,
+    ):
+        """Set the tensors that the next call to :meth:`step_wait` writes its outputs into.
+
+        The buffers are only used for a single step. The step then returns the given tensors in place of
+        the observations, rewards and dones. Outputs without a buffer are returned as usual.
+
+        Args:
+            obs_out: Tensor of shape (num_envs, *obs_shape) for the observations.
+            rew_out: Tensor of shape (num_envs,) for the rewards.
+            done_out: Tensor of shape (num_envs,) for the dones.
+        """
+        self._output_buffers = (obs_out, rew_out, done_out)
+
+    def get_obs_tensor(self, obs_dict: dict) -> torch.Tensor:
+        """Policy observations of the environment without a copy to the host."""
+        return obs_dict["policy"]
+
+    def reset(self) -> torch.Tensor:  # noqa: D102
+        obs_dict, _ = self.env.reset()
+        return self.get_obs_tensor(obs_dict)
+
+    def step_wait(self) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, list[dict]]:  # noqa: D102
+        obs_dict, rew, terminated, truncated, extras = self.env.step(self._async_actions)
+        # update episode statistics
+        self._ep_rew_buf += rew
+        self._ep_len_buf += 1
+        dones = terminated | truncated
+        reset_ids = (dones > 0).nonzero(as_tuple=False)
+
+        # write the outputs into the buffers of the caller, if any
+        obs_out, rew_out, done_out = self._output_buffers
+        self._output_buffers = (None, None, None)
+        obs = _write_output(obs_out, self.get_obs_tensor(obs_dict))
+        rew = _write_output(rew_out, rew)
+        dones = _write_output(done_out, dones)
+        # only the per-env infos are built on the host
+        infos = self._process_extras(obs, terminated.cpu().numpy(), truncated.cpu().numpy(), extras, reset_ids)
+
+        # reset episode statistics of the terminated environments
+        self._ep_rew_buf[reset_ids] = 0
+        self._ep_len_buf[reset_ids] = 0
+        return obs, rew, dones, infos
+
+
+class PinnedSb3VecEnvWrapper(Sb3VecEnvWrapper):
+    """Stable-Baselines3 wrapper that copies the step outputs to the host through preallocated pinned buffers.
+
+    This is used when the agent consumes numpy arrays. The device-to-host copies of a step are issued
+    asynchronously into page-locked memory and synchronized once. Every output alternates between two
+    buffers, so the arrays of the previous step (which the agent keeps as its last observation) stay valid.
+    """
+
+    def __init__(self, env):
+        super().__init__(env)
+        self._host_bufs: dict[tuple[str, int], torch.Tensor] = {}
+        self._slot = 0
+
+    def reset(self) -> np.ndarray:  # noqa: D102
+        obs_dict, _ = self.env.reset()
+        self._slot ^= 1
+        obs = self._process_obs(obs_dict)
+        self._synchronize()
+        return obs
+
+    def step_wait(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:  # noqa: D102
+        obs_dict, rew, terminated, truncated, extras = self.env.step(self._async_actions)
+        # update episode statistics
+        self._ep_rew_buf += rew
+        self._ep_len_buf += 1
+        dones = terminated | truncated
+        reset_ids = (dones > 0).nonzero(as_tuple=False)
+
+        # stage all outputs on the host and wait for the copies once
+        self._slot ^= 1
+        obs = self._process_obs(obs_dict)
+        rew = self._to_host("rew", rew)
+        terminated = self._to_host("terminated", terminated)
+        truncated = self._to_host("truncated", truncated)
+        dones = self._to_host("dones", dones)
+        self._synchronize()
+
+        infos = self._process_extras(obs, terminated, truncated, extras, reset_ids)
+
+        # reset episode statistics of the terminated environments
+        self._ep_rew_buf[reset_ids] = 0
+        self._ep_len_buf[reset_ids] = 0
+        return obs, rew, dones, infos
+
+    def _process_obs(self, obs_dict: dict) -> np.ndarray | dict[str, np.ndarray]:
+        obs = obs_dict["policy"]
+        if isinstance(obs, dict):
+            return {key: self._to_host(f"obs/{key}", value) for key, value in obs.items()}
+        return self._to_host("obs", obs)
+
+    def _to_host(self, name: str, tensor: torch.Tensor) -> np.ndarray:
+        """Copy a tensor into the current host buffer of the given name and return a numpy view of it."""
+        key = (name, self._slot)
+        buf = self._host_bufs.get(key)
+        if buf is None or buf.shape != tensor.shape or buf.dtype != tensor.dtype:
+            buf = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=tensor.is_cuda)
+            self._host_bufs[key] = buf
+        buf.copy_(tensor.detach(), non_blocking=tensor.is_cuda)
+        return buf.numpy()
+
+    def _synchronize(self):
+        """Wait for the asynchronous copies to the host."""
+        if torch.device(self.sim_device).type == "cuda":
+            torch.cuda.current_stream(self.sim_device).synchronize()
+
+
+class TorchRunningMeanStd(RunningMeanStd):
+    """Running mean and variance of a data stream, kept as float64 tensors on the device.
+
+    The statistics are merged with the parallel variant of Welford's algorithm, like :class:`RunningMeanStd`.
+    """
+
+    def __init__(self, epsilon: float = 1e-4, shape: tuple[int, ...] = (), device: torch.device | str = "cpu"):
+        self.mean = torch.zeros(shape, dtype=torch.float64, device=device)
+        self.var = torch.ones(shape, dtype=torch.float64, device=device)
+        self.count = epsilon
+
+    def __getstate__(self) -> dict:
+        # store the statistics on the host so that they can be loaded without a GPU
+        return {"mean": self.mean.cpu(), "var": self.var.cpu(), "count": self.count}
+
+    def to(self, device: torch.device | str) -> TorchRunningMeanStd:
+        """Move the statistics to the given device."""
+        self.mean = self.mean.to(device)
+        self.var = self.var.to(device)
+        return self
+
+    def copy(self) -> TorchRunningMeanStd:  # noqa: D102
+        new_object = TorchRunningMeanStd(shape=tuple(self.mean.shape), device=self.mean.device)
+        new_object.mean = self.mean.clone()
+        new_object.var = self.var.clone()
+        new_object.count = float(self.count)
+        return new_object
+
+    def update(self, arr: torch.Tensor) -> None:  # noqa: D102
+        arr = arr.to(dtype=torch.float64)
+        batch_mean = arr.mean(dim=0)
+        batch_var = arr.var(dim=0, unbiased=False)
+        self.update_from_moments(batch_mean, batch_var, arr.shape[0])
+
+    def update_from_moments(self, batch_mean: torch.Tensor, batch_var: torch.Tensor, batch_count: float) -> None:
+        delta = batch_mean - self.mean
+        tot_count = self.count + batch_count
+
+        self.mean = self.mean + delta * batch_count / tot_count
+        m_a = self.var * self.count
+        m_b = batch_var * batch_count
+        m_2 = m_a + m_b + delta.square() * self.count * batch_count / tot_count
+        self.var = m_2 / tot_count
+        self.count = tot_count
+
+
+class GPUVecNormalize(VecNormalize):
+    """VecNormalize for environments that return tensors, such as :class:`TorchVecEnvWrapper`.
+
+    The running statistics are :class:`TorchRunningMeanStd` on the simulation device, so normalizing does not
+    require a copy to the host. Only flat (box) observations are supported.
+    """
+
+    _output_buffers: tuple[torch.Tensor | None, ...] = (None, None, None)
+
+    def set_output_buffer(
+        self,
+        obs_out: torch.Tensor | None = None,
+        rew_out: torch.Tensor | None = None,
+        done_out: torch.Tensor | None = None,
+    ):
+        """Set the tensors that the next step writes its normalized outputs into.
+
+        See :meth:`TorchVecEnvWrapper.set_output_buffer`. The wrapped environment still returns its raw
+        outputs, since these are kept as the original observations and rewards.
+        """
+        self._output_buffers = (obs_out, rew_out, done_out)
+
+    def __init__(self, venv: VecEnv, *args, **kwargs):
+        super().__init__(venv, *args, **kwargs)
+        if isinstance(self.observation_space, spaces.Dict):
+            raise ValueError("GPUVecNormalize only supports 'gym.spaces.Box' observation spaces.")
+        if self.norm_obs:
+            self.obs_rms = TorchRunningMeanStd(shape=self.observation_space.shape, device=venv.sim_device)
+        self.ret_rms = TorchRunningMeanStd(shape=(), device=venv.sim_device)
+        self.returns = torch.zeros(self.num_envs, dtype=torch.float64, device=venv.sim_device)
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        # store the last step on the host, like the statistics, so that it can be loaded without a GPU
+        for key in ("old_obs", "old_reward"):
+            if isinstance(state.get(key), torch.Tensor):
+                state[key] = state[key].cpu()
+        state.pop("_output_buffers", None)
+        return state
+
+    def set_venv(self, venv: VecEnv) -> None:  # noqa: D102
+        super().set_venv(venv)
+        # statistics are unpickled on the host
+        if self.norm_obs:
+            self.obs_rms.to(venv.sim_device)
+        self.ret_rms.to(venv.sim_device)
+        self.returns = torch.zeros(self.num_envs, dtype=torch.float64, device=venv.sim_device)
+
+    def step_wait(self) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, list[dict]]:  # noqa: D102
+        obs, rewards, dones, infos = self.venv.step_wait()
+        self.old_obs = obs
+        self.old_reward = rewards
+
+        if self.training and self.norm_obs:
+            self.obs_rms.update(obs)
+        obs = self.normalize_obs(obs)
+
+        if self.training:
+            self._update_reward(rewards)
+        rewards = self.normalize_reward(rewards)
+
+        # normalize the terminal observations
+        for info in infos:
+            if info.get("terminal_observation") is not None:
+                info["terminal_observation"] = self.normalize_obs(info["terminal_observation"])
+
+        self.returns[dones] = 0
+
+        obs_out, rew_out, done_out = self._output_buffers
+        self._output_buffers = (None, None, None)
+        return _write_output(obs_out, obs), _write_output(rew_out, rewards), _write_output(done_out, dones), infos
+
+    def reset(self) -> torch.Tensor:  # noqa: D102
+        obs = self.venv.reset()
+        self.old_obs = obs
+        self.returns.zero_()
+        if self.training and self.norm_obs:
+            self.obs_rms.update(obs)
+        return self.normalize_obs(obs)
+
+    def _normalize_obs(self, obs: torch.Tensor, obs_rms: TorchRunningMeanStd) -> torch.Tensor:
+        # the difference is a new tensor, so scaling and clipping can be done in-place
+        obs = obs - obs_rms.mean
+        obs.div_(torch.sqrt(obs_rms.var + self.epsilon)).clamp_(-self.clip_obs, self.clip_obs)
+        return obs.float()
+
+    def _unnormalize_obs(self, obs: torch.Tensor, obs_rms: TorchRunningMeanStd) -> torch.Tensor:
+        return (obs * torch.sqrt(obs_rms.var + self.epsilon) + obs_rms.mean).float()
+
+    def normalize_obs(self, obs: torch.Tensor) -> torch.Tensor:  # noqa: D102
+        if self.norm_obs:
+            return self._normalize_obs(obs, self.obs_rms)
+        return obs
+
+    def unnormalize_obs(self, obs: torch.Tensor) -> torch.Tensor:  # noqa: D102
+        if self.norm_obs:
+            return self._unnormalize_obs(obs, self.obs_rms)
+        return obs
+
+    def normalize_reward(self, reward: torch.Tensor) -> torch.Tensor:  # noqa: D102
+        if self.norm_reward:
+            reward = reward / torch.sqrt(self.ret_rms.var + self.epsilon)
+            return reward.clamp_(-self.clip_reward, self.clip_reward).float()
+        return reward
+
+    def unnormalize_reward(self, reward: torch.Tensor) -> torch.Tensor:  # noqa: D102
+        if self.norm_reward:
+            return (reward * torch.sqrt(self.ret_rms.var + self.epsilon)).float()
+        return reward
+
+    def get_original_obs(self) -> torch.Tensor:  # noqa: D102
+        return self.old_obs.clone()
+
+    def get_original_reward(self) -> torch.Tensor:  # noqa: D102
+        return self.old_reward.clone()
+
+
+def _obs_storage_dtype(space: spaces.Space) -> torch.dtype:
+    """Smallest dtype that holds every observation of the space exactly.
+
+    Only integer spaces with known bounds are stored in a narrower dtype, floating point observations are
+    kept in float32.
+    """
+    if isinstance(space, spaces.Discrete):
+        low, high = space.start, space.start + space.n - 1
+    elif isinstance(space, spaces.MultiDiscrete):
+        low, high = space.start.min(), (space.start + space.nvec).max() - 1
+    elif isinstance(space, spaces.MultiBinary):
+        low, high = 0, 1
+    elif isinstance(space, spaces.Box) and np.issubdtype(space.dtype, np.integer):
+        low, high = space.low.min(), space.high.max()
+    else:
+        return torch.float32
+    for dtype in (torch.uint8, torch.int8, torch.int16):
+        info = torch.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    # larger integers are not exact in float32 either
+    return torch.float32
+
+
+class GPURolloutBuffer(RolloutBuffer):
+    """Rollout buffer that stores all transitions as tensors on the policy device.
+
+    The storage is allocated once and reused for every rollout. Minibatches are contiguous slices of a single
+    shuffled copy of the buffer, so no host-to-device copies happen during training.
+
+    Observations of bounded integer spaces are stored in the smallest integer dtype that fits them, which
+    reduces the memory traffic of the buffer. The policy casts them to float when preprocessing. Normalized
+    observations must be stored as float, which :class:`GPUPPO` does through ``obs_dtype``.
+
+    Args:
+        obs_dtype: Storage dtype of the observations, e.g. ``torch.float16`` for observations that tolerate the
+            lower precision. Defaults to None, in which case it is derived from the observation space.
+    """
+
+    def __init__(self, *args, obs_dtype: torch.dtype | None = None, **kwargs):
+        self.obs_dtype = obs_dtype
+        super().__init__(*args, **kwargs)
+
+    def reset(self) -> None:  # noqa: D102
+        if not hasattr(self, "_storage"):
+            shape = (self.buffer_size, self.n_envs)
+            if self.obs_dtype is None:
+                self.obs_dtype = _obs_storage_dtype(self.observation_space)
+            self.observations = torch.zeros((*shape, *self.obs_shape), dtype=self.obs_dtype, device=self.device)
+            self.actions = torch.zeros((*shape, self.action_dim), dtype=torch.float32, device=self.device)
+            self.rewards = torch.zeros(shape, dtype=torch.float32, device=self.device)
+            self.returns = torch.zeros(shape, dtype=torch.float32, device=self.device)
+            self.episode_starts = torch.zeros(shape, dtype=torch.float32, device=self.device)
+            self.values = torch.zeros(shape, dtype=torch.float32, device=self.device)
+            self.log_probs = torch.zeros(shape, dtype=torch.float32, device=self.device)
+            self.advantages = torch.zeros(shape, dtype=torch.float32, device=self.device)
+            self._storage = True
+        self.generator_ready = False
+        self.pos = 0
+        self.full = False
+
+    def add(
+        self,
+        obs: torch.Tensor | np.ndarray,
+        action: torch.Tensor | np.ndarray,
+        reward: torch.Tensor | np.ndarray,
+        episode_start: torch.Tensor | np.ndarray,
+        value: torch.Tensor,
+        log_prob: torch.Tensor,
+    ) -> None:  # noqa: D102
+        self._store(self.observations[self.pos], obs)
+        self._store(self.actions[self.pos], action)
+        self._store(self.rewards[self.pos], reward)
+        self._store(self.episode_starts[self.pos], episode_start)
+        self._store(self.values[self.pos], value)
+        self._store(self.log_probs[self.pos], log_prob)
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+
+    @staticmethod
+    def _store(slot: torch.Tensor, data: torch.Tensor | np.ndarray):
+        """Copy the data into a slot of the buffer, unless it was already written there by the environment."""
+        if isinstance(data, torch.Tensor) and data.data_ptr() == slot.data_ptr():
+            return
+        slot.copy_(torch.as_tensor(data).reshape(slot.shape))
+
+    def compute_returns_and_advantage(self, last_values: torch.Tensor, dones: torch.Tensor | np.ndarray) -> None:
+        """Compute the lambda-returns and GAE(lambda) advantages on the device.
+
+        Args:
+            last_values: Value estimates of the last observations, one for each environment.
+            dones: Whether the last step was terminal, one for each environment.
+        """
+        last_values = last_values.reshape(self.n_envs)
+        dones = torch.as_tensor(dones, device=self.device).reshape(self.n_envs).float()
+
+        last_gae_lam = torch.zeros(self.n_envs, dtype=torch.float32, device=self.device)
+        for step in reversed(range(self.buffer_size)):
+            if step == self.buffer_size - 1:
+                next_non_terminal = 1.0 - dones
+                next_values = last_values
+            else:
+                next_non_terminal = 1.0 - self.episode_starts[step + 1]
+                next_values = self.values[step + 1]
+            delta = self.rewards[step] + self.gamma * next_values * next_non_terminal - self.values[step]
+            last_gae_lam = delta + self.gamma * self.gae_lambda * next_non_terminal * last_gae_lam
+            self.advantages[step] = last_gae_lam
+        # TD(lambda) estimator
+        torch.add(self.advantages, self.values, out=self.returns)
+
+    def get(self, batch_size: int | None = None) -> Generator[RolloutBufferSamples, None, None]:  # noqa: D102
+        assert self.full, ""
+        num_samples = self.buffer_size * self.n_envs
+        if batch_size is None:
+            batch_size = num_samples
+
+        # shuffle all data once, so that every minibatch is a contiguous view
+        indices = torch.randperm(num_samples, device=self.device)
+        data = self._flat_samples(indices)
+
+        start_idx = 0
+        while start_idx < num_samples:
+            length = min(batch_size, num_samples - start_idx)
+            yield RolloutBufferSamples(*(tensor.narrow(0, start_idx, length) for tensor in data))
+            start_idx += batch_size
+
+    def _get_samples(self, batch_inds: np.ndarray | torch.Tensor, env=None) -> RolloutBufferSamples:
+        return RolloutBufferSamples(*self._flat_samples(torch.as_tensor(batch_inds, device=self.device)))
+
+    def _flat_samples(self, indices: torch.Tensor) -> tuple[torch.Tensor, ...]:
+        """Gather the transitions at the given flat indices in the order of :class:`RolloutBufferSamples`."""
+        num_samples = self.buffer_size * self.n_envs
+        return (
+            self.observations.reshape(num_samples, *self.obs_shape)[indices],
+            self.actions.reshape(num_samples, self.action_dim)[indices],
+            self.values.reshape(num_samples)[indices],
+            self.log_probs.reshape(num_samples)[indices],
+            self.advantages.reshape(num_samples)[indices],
+            self.returns.reshape(num_samples)[indices],
+        )
+
+
+class GPUPPO(PPO):
+    """PPO that collects rollouts and trains on tensors that never leave the device.
+
+    It expects an environment that returns tensors, such as :class:`TorchVecEnvWrapper`, and stores the
+    rollouts in a :class:`GPURolloutBuffer`. The environment writes every step directly into the slots of
+    the rollout buffer through ``set_output_buffer``.
+    """
+
+    def _setup_model(self) -> None:
+        # the buffer is created by the parent class, which also passes the rollout buffer kwargs (e.g. obs_dtype)
+        self.rollout_buffer_class = GPURolloutBuffer
+        rollout_buffer_kwargs = dict(self.rollout_buffer_kwargs)
+        obs_dtype = rollout_buffer_kwargs.pop("obs_dtype", None)
+        # normalized observations are floats, even for integer observation spaces
+        vec_normalize_env = self.get_vec_normalize_env()
+        if obs_dtype is None and vec_normalize_env is not None and vec_normalize_env.norm_obs:
+            obs_dtype = torch.float32
+        # the dtype is only passed while the buffer is built, since the saved kwargs are also passed to the
+        # rollout buffer of the stock PPO, which does not accept it
+        self.rollout_buffer_kwargs = {**rollout_buffer_kwargs, "obs_dtype": obs_dtype}
+        try:
+            super()._setup_model()
+        finally:
+            self.rollout_buffer_kwargs = rollout_buffer_kwargs
+        self._fuse_optimizer()
+
+    def set_parameters(self, *args, **kwargs) -> None:  # noqa: D102
+        super().set_parameters(*args, **kwargs)
+        # loading the optimizer state replaces the parameter groups, including their fused flag
+        self._fuse_optimizer()
+
+    def _fuse_optimizer(self):
+        """Update all parameters in a single fused kernel instead of launching a few kernels per parameter.
+
+        This applies to Adam and AdamW on CUDA, unless ``fused`` or ``foreach`` is set in the optimizer kwargs.
+        """
+        optimizer = self.policy.optimizer
+        optimizer_kwargs = self.policy.optimizer_kwargs
+        if (
+            self.device.type != "cuda"
+            or type(optimizer) not in (torch.optim.Adam, torch.optim.AdamW)
+            or "fused" in optimizer_kwargs
+            or "foreach" in optimizer_kwargs
+        ):
+            return
+        for group in optimizer.param_groups:
+            group["fused"] = True
+            group["foreach"] = None
+            # the fused kernel expects the step counts as float32 on the device of the parameters
+            for param in group["params"]:
+                state = optimizer.state.get(param)
+                if state and "step" in state:
+                    state["step"] = state["step"].to(device=param.device, dtype=torch.float32)
+
+    def _excluded_save_params(self) -> list[str]:
+        # the last observations are device tensors and are re-created by resetting the environment, and the
+        # buffer class is set on setup, which keeps the saved agent loadable by the stock PPO
+        return super()._excluded_save_params() + [
+            "_last_obs",
+            "_last_original_obs",
+            "_last_episode_starts",
+            "_action_bounds",
+            "rollout_buffer_class",
+        ]
+
+    def predict_tensor(self, observation: torch.Tensor, deterministic: bool = False) -> torch.Tensor:
+        """Get the actions of the policy for a batch of observations, without leaving the device.
+
+        Unlike :meth:`predict`, the observations are not converted from numpy and the actions are not
+        returned as numpy arrays. Recurrent policies are not supported.
+
+        Args:
+            observation: The observations, as returned by :class:`TorchVecEnvWrapper`.
+            deterministic: Whether to return deterministic actions. Defaults to False.
+
+        Returns:
+            The actions, rescaled or clipped to the action space.
+        """
+        self.policy.set_training_mode(False)
+        with torch.no_grad():
+            actions = self.policy._predict(observation.to(self.device), deterministic=deterministic)
+        return self._clip_actions(actions)
+
+    def _clip_actions(self, actions: torch.Tensor) -> torch.Tensor:
+        """Rescale (squashed policies) or clip the actions to the bounds of a box action space."""
+        if not isinstance(self.action_space, spaces.Box):
+            return actions
+        if getattr(self, "_action_bounds", None) is None:
+            self._action_bounds = (
+                torch.as_tensor(self.action_space.low, device=self.device),
+                torch.as_tensor(self.action_space.high, device=self.device),
+            )
+        action_low, action_high = self._action_bounds
+        if self.policy.squash_output:
+            return action_low + 0.5 * (actions + 1.0) * (action_high - action_low)
+        return torch.clamp(actions, action_low, action_high)
+
+    def collect_rollouts(
+        self,
+        env: VecEnv,
+        callback: BaseCallback,
+        rollout_buffer: GPURolloutBuffer,
+        n_rollout_steps: int,
+    ) -> bool:
+        """Collect experiences using the current policy and fill the rollout buffer.
+
+        Args:
+            env: The training environment.
+            callback: Callback that will be called at each step (and at the beginning and end of the rollout).
+            rollout_buffer: Buffer to fill with rollouts.
+            n_rollout_steps: Number of experiences to collect per environment.
+
+        Returns:
+            True if the rollout was completed, False if the callback terminated it early.
+        """
+        assert self._last_obs is not None, "No previous observation was provided"
+        # switch to eval mode (this affects batch norm / dropout)
+        self.policy.set_training_mode(False)
+
+        n_steps = 0
+        rollout_buffer.reset()
+        # sample new weights for the state dependent exploration
+        if self.use_sde:
+            self.policy.reset_noise(env.num_envs)
+
+        callback.on_rollout_start()
+
+        while n_steps < n_rollout_steps:
+            if self.use_sde and self.sde_sample_freq > 0 and n_steps % self.sde_sample_freq == 0:
+                # sample a new noise matrix
+                self.policy.reset_noise(env.num_envs)
+
+            with torch.no_grad():
+                obs_tensor = torch.as_tensor(self._last_obs, device=self.device)
+                actions, values, log_probs = self.policy(obs_tensor)
+
+            # rescale and perform action
+            clipped_actions = self._clip_actions(actions)
+
+            # the next observations and episode starts go into the next slot, which the last step does not have
+            pos = rollout_buffer.pos
+            if pos + 1 < rollout_buffer.buffer_size:
+                env.set_output_buffer(
+                    rollout_buffer.observations[pos + 1],
+                    rollout_buffer.rewards[pos],
+                    rollout_buffer.episode_starts[pos + 1],
+                )
+            else:
+                env.set_output_buffer(rew_out=rollout_buffer.rewards[pos])
+            new_obs, rewards, dones, infos = env.step(clipped_actions)
+
+            self.num_timesteps += env.num_envs
+
+            # give access to local variables
+            callback.update_locals(locals())
+            if not callback.on_step():
+                return False
+
+            self._update_info_buffer(infos, dones)
+            n_steps += 1
+
+            if isinstance(self.action_space, spaces.Discrete):
+                # reshape in case of discrete action
+                actions = actions.reshape(-1, 1)
+
+            # handle timeout by bootstrapping with the value function
+            timeout_ids = [
+                idx
+                for idx, info in enumerate(infos)
+                if info.get("terminal_observation") is not None and info.get("TimeLimit.truncated", False)
+            ]
+            rollout_buffer.add(self._last_obs, actions, rewards, self._last_episode_starts, values, log_probs)
+            if timeout_ids:
+                terminal_obs = torch.stack([torch.as_tensor(infos[idx]["terminal_observation"]) for idx in timeout_ids])
+                with torch.no_grad():
+                    terminal_values = self.policy.predict_values(terminal_obs.to(self.device)).flatten()
+                # bootstrap the stored rewards in-place
+                rollout_buffer.rewards[pos, timeout_ids] += self.gamma * terminal_values
+            self._last_obs = new_obs
+            self._last_episode_starts = dones
+
+        with torch.no_grad():
+            # compute value for the last timestep
+            values = self.policy.predict_values(torch.as_tensor(new_obs, device=self.device))
+
+        rollout_buffer.compute_returns_and_advantage(last_values=values, dones=dones)
+
+        callback.update_locals(locals())
+
+        callback.on_rollout_end()
+
+        return True
+
+    def train(self) -> None:
+        """Update the policy using the current rollout buffer.
+
+        Same update as :meth:`PPO.train`, but the logged statistics are accumulated on the device and only
+        copied to the host once per update.
+        """
+        # switch to train mode (this affects batch norm / dropout)
+        self.policy.set_training_mode(True)
+        # update optimizer learning rate
+        self._update_learning_rate(self.policy.optimizer)
+        # compute current clip range
+        clip_range = self.clip_range(self._current_progress_remaining)
+        # optional: clip range for the value function
+        if self.clip_range_vf is not None:
+            clip_range_vf = self.clip_range_vf(self._current_progress_remaining)
+
+        entropy_losses, pg_losses, value_losses, clip_fractions = [], [], [], []
+
+        continue_training = True
+        # train for n_epochs epochs
+        for epoch in range(self.n_epochs):
+            approx_kl_divs = []
+            # do a complete pass on the rollout buffer
+            for rollout_data in self.rollout_buffer.get(self.batch_size):
+                actions = rollout_data.actions
+                if isinstance(self.action_space, spaces.Discrete):
+                    # convert discrete action from float to long
+                    actions = rollout_data.actions.long().flatten()
+
+                # re-sample the noise matrix because the log_std has changed
+                if self.use_sde:
+                    self.policy.reset_noise(self.batch_size)
+
+                values, log_prob, entropy = self.policy.evaluate_actions(rollout_data.observations, actions)
+                values = values.flatten()
+                # normalize advantage
+                advantages = rollout_data.advantages
+                if self.normalize_advantage and len(advantages) > 1:
+                    advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+
+                # ratio between old and new policy, should be one at the first iteration
+                ratio = torch.exp(log_prob - rollout_data.old_log_prob)
+
+                # clipped surrogate loss
+                policy_loss_1 = advantages * ratio
+                policy_loss_2 = advantages * torch.clamp(ratio, 1 - clip_range, 1 + clip_range)
+                policy_loss = -torch.min(policy_loss_1, policy_loss_2).mean()
+
+                if self.clip_range_vf is None:
+                    # no clipping
+                    values_pred = values
+                else:
+                    # clip the difference between old and new value
+                    values_pred = rollout_data.old_values + torch.clamp(
+                        values - rollout_data.old_values, -clip_range_vf, clip_range_vf
+                    )
+                # value loss using the TD(gae_lambda) target
+                value_loss = F.mse_loss(rollout_data.returns, values_pred)
+
+                # entropy loss favor exploration
+                if entropy is None:
+                    # approximate entropy when no analytical form
+                    entropy_loss = -torch.mean(-log_prob)
+                else:
+                    entropy_loss = -torch.mean(entropy)
+
+                loss = policy_loss + self.ent_coef * entropy_loss + self.vf_coef * value_loss
+
+                # logging
+                with torch.no_grad():
+                    pg_losses.append(policy_loss.detach())
+                    value_losses.append(value_loss.detach())
+                    entropy_losses.append(entropy_loss.detach())
+                    clip_fractions.append(torch.mean((torch.abs(ratio - 1) > clip_range).float()))
+                    # approximate form of reverse KL divergence for early stopping
+                    log_ratio = log_prob - rollout_data.old_log_prob
+                    approx_kl_divs.append(torch.mean((torch.exp(log_ratio) - 1) - log_ratio))
+
+                # checking the KL divergence requires a sync, so only do it when early stopping is enabled
+                if self.target_kl is not None and approx_kl_divs[-1].item() > 1.5 * self.target_kl:
+                    continue_training = False
+                    if self.verbose >= 1:
+                        print(f"Early stopping at step {epoch} due to reaching max kl: {approx_kl_divs[-1]:.2f}")
+                    break
+
+                # optimization step
+                self.policy.optimizer.zero_grad()
+                loss.backward()
+                # clip grad norm
+                torch.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+                self.policy.optimizer.step()
+
+            self._n_updates += 1
+            if not continue_training:
+                break
+
+        with torch.no_grad():
+            y_pred = self.rollout_buffer.values.flatten()
+            y_true = self.rollout_buffer.returns.flatten()
+            var_y = torch.var(y_true, unbiased=False)
+            explained_var = 1 - torch.var(y_true - y_pred, unbiased=False) / var_y
+
+        # logs
+        self.logger.record("train/entropy_loss", torch.stack(entropy_losses).mean().item())
+        self.logger.record("train/policy_gradient_loss", torch.stack(pg_losses).mean().item())
+        self.logger.record("train/value_loss", torch.stack(value_losses).mean().item())
+        self.logger.record("train/approx_kl", torch.stack(approx_kl_divs).mean().item())
+        self.logger.record("train/clip_fraction", torch.stack(clip_fractions).mean().item())
+        self.logger.record("train/loss", loss.item())
+        self.logger.record("train/explained_variance", np.nan if var_y.item() == 0 else explained_var.item())
+        if hasattr(self.policy, "log_std"):
+            self.logger.record("train/std", torch.exp(self.policy.log_std).mean().item())
+
+        self.logger.record("train/n_updates", self._n_updates, exclude="tensorboard")
+        self.logger.record("train/clip_range", clip_range)
+        if self.clip_range_vf is not None:
+            self.logger.record("train/clip_range_vf", clip_range_vf)
+
+
+def build_vecnormalize(env: VecEnv, agent_cfg: dict, vec_normalize_class: type[VecNormalize] = VecNormalize) -> VecEnv:
+    """Wrap the environment for observation and reward normalization as set in the agent configuration.
+
+    The normalization keys ``normalize_input``, ``normalize_value`` and ``clip_obs`` are removed from the
+    configuration, so that the remaining entries can be passed to the agent.
+
+    Args:
+        env: The environment to wrap.
+        agent_cfg: The processed agent configuration. It is modified in-place.
+        vec_normalize_class: The normalization wrapper, e.g. :class:`GPUVecNormalize` for tensor environments.
+            Defaults to :class:`VecNormalize`.
+
+    Returns:
+        The wrapped environment, or the environment itself if neither normalization is enabled.
+    """
+    norm_obs = agent_cfg.pop("normalize_input", False)
+    norm_reward = agent_cfg.pop("normalize_value", False)
+    # use the default of VecNormalize if the clipping is not set
+    clip_obs = agent_cfg.pop("clip_obs", 10.0)
+    if not (norm_obs or norm_reward):
+        return env
+    return vec_normalize_class(
+        env,
+        training=True,
+        norm_obs=norm_obs,
+        norm_reward=norm_reward,
+        clip_obs=clip_obs,
+        gamma=agent_cfg["gamma"],
+        clip_reward=np.inf,
+    )
+
+
+def load_ppo_mmap(
+    path: str,
+    env: VecEnv | None = None,
+    device: torch.device | str = "auto",
+    agent_class: type[PPO] = GPUPPO,
+    custom_objects: dict | None = None,
+) -> PPO:
+    """Load a PPO agent saved with :meth:`PPO.save` without reading its parameters into memory first.
+
+    :meth:`PPO.load` reads every ``.pth`` file of the archive into an in-memory buffer before deserializing it.
+    Here, the files are extracted to a temporary directory and memory-mapped instead, so the parameters are
+    copied straight from the mapped pages into the tensors of the new agent. Otherwise, the agent is restored
+    the same way as by :meth:`PPO.load`. Archives whose files hold more than tensors and plain containers are
+    loaded with :meth:`PPO.load`.
+
+    Args:
+        path: Path to the zip-file of the saved agent.
+        env: The environment to run the loaded agent on. Defaults to None.
+        device: Device of the agent. Defaults to "auto".
+        agent_class: The PPO class to create. Defaults to :class:`GPUPPO`.
+        custom_objects: Objects to use instead of the deserialized ones, see :meth:`PPO.load`. Defaults to None.
+
+    Returns:
+        The loaded agent.
+    """
+    device = get_device(device)
+    with zipfile.ZipFile(path) as archive, tempfile.TemporaryDirectory() as tmp_dir:
+        params, pytorch_variables = {}, None
+        for file_name in archive.namelist():
+            if os.path.splitext(file_name)[1] != ".pth":
+                continue
+            # keep the tensors on the mapped pages, load_state_dict() copies them to the device
+            try:
+                tensors = torch.load(
+                    archive.extract(file_name, tmp_dir), map_location="cpu", mmap=True, weights_only=True
+                )
+            except pickle.UnpicklingError:
+                return agent_class.load(path, env=env, device=device, custom_objects=custom_objects)
+            if file_name in ("pytorch_variables.pth", "tensors.pth"):
+                pytorch_variables = tensors
+            else:
+                params[os.path.splitext(file_name)[0]] = tensors
+
+        data = json_to_data(archive.read("data").decode(), custom_objects=custom_objects)
+        if "policy_kwargs" in data:
+            data["policy_kwargs"].pop("device", None)
+            # backward compatibility with the net_arch format of SB3 < 1.8.0
+            saved_net_arch = data["policy_kwargs"].get("net_arch")
+            if isinstance(saved_net_arch, list) and len(saved_net_arch) > 0 and isinstance(saved_net_arch[0], dict):
+                data["policy_kwargs"]["net_arch"] = saved_net_arch[0]
+        for key in ("observation_space", "action_space"):
+            data[key] = _convert_space(data[key])
+
+        if env is not None:
+            env = agent_class._wrap_env(env, data["verbose"])
+            check_for_correct_spaces(env, data["observation_space"], data["action_space"])
+            # force a reset before training
+            data["_last_obs"] = None
+            data["n_envs"] = env.num_envs
+        else:
+            env = data.get("env")
+
+        agent = agent_class(policy=data["policy_class"], env=env, device=device, _init_setup_model=False)
+        agent.__dict__.update(data)
+        agent._setup_model()
+
+        try:
+            agent.set_parameters(params, exact_match=True, device=device)
+        except RuntimeError as e:
+            # models saved with SB3 < 1.7.0 have no separate features extractor of the policy
+            if "pi_features_extractor" in str(e) and "Missing key(s) in state_dict" in str(e):
+                agent.set_parameters(params, exact_match=False, device=device)
+                warnings.warn(f"Loaded a model saved with SB3 < 1.7.0, save it again to update it. Original error: {e}")
+            else:
+                raise
+        if pytorch_variables is not None:
+            for name, value in pytorch_variables.items():
+                if value is not None:
+                    recursive_setattr(agent, f"{name}.data", value.data.to(device))
+
+    if agent.use_sde:
+        agent.policy.reset_noise()
+    return agent
+
+
+class AsyncCheckpointCallback(CheckpointCallback):
+    """CheckpointCallback that writes the checkpoints on a background thread.
+
+    The attributes of the agent are serialized on the training thread and its parameters are copied into
+    pinned host buffers, which are reused for every checkpoint. Only writing the zip-file, in the same
+    format as :meth:`PPO.save`, happens on the background thread. Since the host buffers are shared, a
+    checkpoint waits for the previous one to be written, and raises any error that occurred while writing it.
+    Replay buffers are not saved.
+
+    Args:
+        compression: Compression method of the zip-files. Defaults to ``zipfile.ZIP_DEFLATED``, which is
+            lossless and readable by :meth:`PPO.load`. The compression runs on the background thread.
+    """
+
+    def __init__(self, *args, compression: int = zipfile.ZIP_DEFLATED, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compression = compression
+        self._host_bufs: dict[str, torch.Tensor] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending: Future | None = None
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.save_freq == 0:
+            model_path = self._checkpoint_path(extension="zip")
+            self._save_async(model_path)
+            if self.verbose >= 2:
+                print(f"Saving model checkpoint to {model_path}")
+
+            if self.save_vecnormalize and self.model.get_vec_normalize_env() is not None:
+                # the statistics are small, so they are saved right away
+                vec_normalize_path = self._checkpoint_path("vecnormalize_", extension="pkl")
+                self.model.get_vec_normalize_env().save(vec_normalize_path)
+                if self.verbose >= 2:
+                    print(f"Saving model VecNormalize to {vec_normalize_path}")
+        return True
+
+    def _on_training_end(self) -> None:
+        self.wait()
+
+    def wait(self):
+        """Block until the last checkpoint is written.
+
+        Raises:
+            Exception: The error that occurred while writing the checkpoint, if any.
+        """
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def _save_async(self, path: str):
+        """Snapshot the agent like :meth:`PPO.save` does and write it to the given path on a background thread."""
+        self.wait()
+        data = self.model.__dict__.copy()
+        exclude = set(self.model._excluded_save_params())
+        state_dicts_names, torch_variable_names = self.model._get_torch_save_params()
+        for torch_var in state_dicts_names + torch_variable_names:
+            exclude.add(torch_var.split(".")[0])
+        for param_name in exclude:
+            data.pop(param_name, None)
+        serialized_data = data_to_json(data)
+
+        params = {
+            name: self._to_host(name, recursive_getattr(self.model, name).state_dict()) for name in state_dicts_names
+        }
+        pytorch_variables = {
+            name: self._to_host(name, recursive_getattr(self.model, name)) for name in torch_variable_names
+        }
+        # wait for the copies once, the buffers are only read by the writer from here on
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+        self._pending = self._executor.submit(
+            self._write, path, serialized_data, params, pytorch_variables, self.compression
+        )
+
+    def _to_host(self, key: str, obj):
+        """Copy all tensors of a (nested) state dict into the pinned host buffer of the same key."""
+        if isinstance(obj, torch.Tensor):
+            buf = self._host_bufs.get(key)
+            if buf is None or buf.shape != obj.shape or buf.dtype != obj.dtype:
+                buf = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=obj.is_cuda)
+                self._host_bufs[key] = buf
+            buf.copy_(obj.detach(), non_blocking=obj.is_cuda)
+            return buf
+        if isinstance(obj, dict):
+            # build new containers, since values like the learning rate change while the checkpoint is written
+            host_obj = type(obj)((k, self._to_host(f"{key}/{k}", v)) for k, v in obj.items())
+            if hasattr(obj, "_metadata"):
+                host_obj._metadata = obj._metadata
+            return host_obj
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._to_host(f"{key}/{i}", v) for i, v in enumerate(obj))
+        return obj
+
+    @staticmethod
+    def _write(path: str, serialized_data: str, params: dict, pytorch_variables: dict, compression: int):
+        """Write a checkpoint in the format of :func:`stable_baselines3.common.save_util.save_to_zip_file`."""
+        with zipfile.ZipFile(path, mode="w", compression=compression) as archive:
+            archive.writestr("data", serialized_data)
+            with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as pytorch_variables_file:
+                torch.save(pytorch_variables, pytorch_variables_file)
+            for file_name, state_dict in params.items():
+                with archive.open(file_name + ".pth", mode="w", force_zip64=True) as param_file:
+                    torch.save(state_dict, param_file)
+            archive.writestr("_stable_baselines3_version", sb3.__version__)
+            archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+
+
+def sbx_policy_kwargs(policy_kwargs: dict) -> dict:
+    """Convert Stable-Baselines3 policy arguments to the ones expected by SBX.
+
+    SBX builds its networks with flax, so PyTorch activation modules are replaced with the flax activation
+    function of the same name. SBX does not support squashed outputs.
+
+    Args:
+        policy_kwargs: The policy arguments of the Stable-Baselines3 agent configuration.
+
+    Returns:
+        The policy arguments for the SBX agent.
+
+    Raises:
+        ValueError: If squashed outputs are requested.
+    """
+    import flax.linen
+
+    policy_kwargs = dict(policy_kwargs)
+    if policy_kwargs.pop("squash_output", False):
+        raise ValueError("SBX policies do not support 'squash_output=True'.")
+    if "activation_fn" in policy_kwargs:
+        policy_kwargs["activation_fn"] = getattr(flax.linen, policy_kwargs["activation_fn"].__name__.lower())
+    return policy_kwargs
+
+
+class NVENCRecordVideo(gym.Wrapper):
+    """Record videos of the environment like :class:`gym.wrappers.RecordVideo`, encoded on the GPU with NVENC.
+
+    The frames are encoded through PyAV as they are rendered, instead of being collected for a CPU encoder
+    when the video is closed. A recording starts at the steps for which ``step_trigger`` is true.
+
+    Args:
+        env: The environment to record.
+        video_folder: Directory to write the videos into.
+        step_trigger: Function of the step count that decides whether a recording starts.
+        video_length: Number of frames of each video. Defaults to 0, which records until the wrapper is closed.
+        name_prefix: Prefix of the video file names. Defaults to "rl-video".
+        codec: Name of the FFmpeg encoder. Defaults to "h264_nvenc".
+        disable_logger: Has no effect, since this wrapper does not log. It is only accepted so that the same
+            keyword arguments can be passed as to :class:`gym.wrappers.RecordVideo`.
+
+    Raises:
+        ImportError: If PyAV is not installed.
+        RuntimeError: If the encoder cannot be opened, e.g. because no NVENC device is available.
+    """
+
+    def __init__(
+        self,
+        env: gym.Env,
+        video_folder: str,
+        step_trigger: Callable[[int], bool],
+        video_length: int = 0,
+        name_prefix: str = "rl-video",
+        codec: str = "h264_nvenc",
+        disable_logger: bool = True,
+    ):
+        import av
+
+        super().__init__(env)
+        self.video_folder = os.path.abspath(video_folder)
+        self.step_trigger = step_trigger
+        self.video_length = video_length
+        self.name_prefix = name_prefix
+        self.codec = codec
+        self.fps = Fraction(self.metadata.get("render_fps", 30)).limit_denominator(1000)
+        # fail early if the encoder is not usable, so the caller can fall back to a CPU encoder
+        context = None
+        try:
+            context = av.CodecContext.create(codec, "w")
+            context.width, context.height, context.pix_fmt = 64, 64, "yuv420p"
+            context.time_base = 1 / self.fps
+            context.open()
+        except Exception as e:
+            raise RuntimeError(f"Unable to open the video encoder '{codec}': {e}") from e
+        finally:
+            # release the probe session right away, since the number of NVENC sessions per GPU is limited
+            # note: recent PyAV versions have no close method and free the context when it is deleted
+            if context is not None and context.is_open and hasattr(context, "close"):
+                context.close()
+            del context
+        os.makedirs(self.video_folder, exist_ok=True)
+
+        self._av = av
+        self._container = None
+        self._stream = None
+        self.step_id = 0
+        self.recorded_frames = 0
+
+    @property
+    def recording(self) -> bool:
+        """Whether a video is being recorded."""
+        return self._container is not None
+
+    def reset(self, **kwargs):  # noqa: D102
+        observations = super().reset(**kwargs)
+        if self.recording:
+            self._capture_frame()
+        elif self.step_trigger(self.step_id):
+            self._start_video()
+        return observations
+
+    def step(self, action):  # noqa: D102
+        observations = self.env.step(action)
+        self.step_id += 1
+        if self.recording:
+            self._capture_frame()
+        elif self.step_trigger(self.step_id):
+            self._start_video()
+        return observations
+
+    def close(self):  # noqa: D102
+        self._close_video()
+        super().close()
+
+    def _start_video(self):
+        self._close_video()
+        path = os.path.join(self.video_folder, f"{self.name_prefix}-step-{self.step_id}.mp4")
+        self._container = self._av.open(path, mode="w")
+        self._stream = self._container.add_stream(self.codec, rate=self.fps)
+        self._stream.pix_fmt = "yuv420p"
+        self.recorded_frames = 0
+        self._capture_frame()
+
+    def _capture_frame(self):
+        frame = self.env.render()
+        if isinstance(frame, torch.Tensor):
+            frame = frame.cpu().numpy()
+        if self.recorded_frames == 0:
+            self._stream.height, self._stream.width = frame.shape[:2]
+        video_frame = self._av.VideoFrame.from_ndarray(np.ascontiguousarray(frame[..., :3]), format="rgb24")
+        self._container.mux(self._stream.encode(video_frame))
+        self.recorded_frames += 1
+        if 0 < self.video_length <= self.recorded_frames:
+            self._close_video()
+
+    def _close_video(self):
+        if self._container is None:
+            return
+        # flush the frames buffered in the encoder
+        self._container.mux(self._stream.encode())
+        self._container.close()
+        self._container = None
+        self._stream = None
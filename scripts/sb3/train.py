@@ -5,9 +5,9 @@
 
 """Script to train RL agent with Stable Baselines3.
 
-Since Stable-Baselines3 does not support buffers living on GPU directly,
-we recommend using smaller number of environments. Otherwise,
-there will be significant overhead in GPU->CPU transfer.
+Stable-Baselines3 does not support buffers living on GPU directly. The agent is therefore
+trained with the helpers in :mod:`sb3_utils`, which keep observations, their normalization
+and the rollout buffer on the device.
 """
 
 """Launch Isaac Sim Simulator first."""
@@ -29,6 +29,16 @@ parser.add_argument(
 parser.add_argument("--num_envs", type=int, default=4, help="Number of environments to simulate.")
 parser.add_argument("--task", type=str, default="Isaac-Maze-v0", help="Name of the task.")
 parser.add_argument("--seed", type=int, default=None, help="Seed used for the environment")
+parser.add_argument(
+    "--algo",
+    type=str,
+    default="sb3_ppo",
+    choices=["sb3_ppo", "sbx_ppo"],
+    help="PPO implementation: Stable-Baselines3 (PyTorch) or SBX (JAX, jit-compiled updates).",
+)
+parser.add_argument(
+    "--compile", action="store_true", default=False, help="Compile the policy networks with torch.compile."
+)
 parser.add_argument(
     "--model_path",
     type=str,
@@ -49,12 +59,13 @@ simulation_app = app_launcher.app
 """Rest everything follows."""
 
 import gymnasium as gym
-import numpy as np
+import copy
 import os
+import torch
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 
-from stable_baselines3 import PPO
-from stable_baselines3.common.callbacks import CheckpointCallback
 from stable_baselines3.common.logger import configure
 from stable_baselines3.common.vec_env import VecNormalize
 
@@ -63,12 +74,31 @@ from omni.isaac.orbit.utils.io import dump_pickle, dump_yaml
 
 import omni.isaac.orbit_tasks  # noqa: F401
 from omni.isaac.orbit_tasks.utils import load_cfg_from_registry, parse_env_cfg
-from omni.isaac.orbit_tasks.utils.wrappers.sb3 import Sb3VecEnvWrapper, process_sb3_cfg
+from omni.isaac.orbit_tasks.utils.wrappers.sb3 import process_sb3_cfg
 import globals
 
 globals.init_globals()
 import orbit.maze  # noqa: F401  TODO: import orbit.<your_extension_name>
 
+# local imports
+from sb3_utils import (  # isort: skip
+    AsyncCheckpointCallback,
+    GPUPPO,
+    GPUVecNormalize,
+    NVENCRecordVideo,
+    PinnedSb3VecEnvWrapper,
+    TorchVecEnvWrapper,
+    build_vecnormalize,
+    load_ppo_mmap,
+    sbx_policy_kwargs,
+)
+
+# use TF32 for the matmuls of the MLP policy, the algorithm search of cudnn does not pay off without convolutions
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+torch.backends.cudnn.deterministic = False
+torch.backends.cudnn.benchmark = False
+
 
 def main():
     """Train with stable-baselines agent."""
@@ -83,12 +113,20 @@ def main():
         agent_cfg["seed"] = args_cli.seed
 
     # directory for logging into
-    log_dir = os.path.join("logs", "sb3", args_cli.task, datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
-    # dump the configuration into log-directory
-    dump_yaml(os.path.join(log_dir, "params", "env.yaml"), env_cfg)
-    dump_yaml(os.path.join(log_dir, "params", "agent.yaml"), agent_cfg)
-    dump_pickle(os.path.join(log_dir, "params", "env.pkl"), env_cfg)
-    dump_pickle(os.path.join(log_dir, "params", "agent.pkl"), agent_cfg)
+    log_dir = Path("logs", "sb3", args_cli.task, datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+    params_dir = log_dir / "params"
+    # create the directory once instead of in each dump
+    params_dir.mkdir(parents=True, exist_ok=True)
+    # dump the configuration into log-directory while the environment is created
+    # note: the configurations are copied since both are modified below
+    env_cfg_dump, agent_cfg_dump = copy.deepcopy(env_cfg), copy.deepcopy(agent_cfg)
+    dump_pool = ThreadPoolExecutor(max_workers=4)
+    dump_futures = [
+        dump_pool.submit(dump_yaml, str(params_dir / "env.yaml"), env_cfg_dump),
+        dump_pool.submit(dump_yaml, str(params_dir / "agent.yaml"), agent_cfg_dump),
+        dump_pool.submit(dump_pickle, str(params_dir / "env.pkl"), env_cfg_dump),
+        dump_pool.submit(dump_pickle, str(params_dir / "agent.pkl"), agent_cfg_dump),
+    ]
 
     # post-process agent configuration
     agent_cfg = process_sb3_cfg(agent_cfg)
@@ -98,54 +136,78 @@ def main():
 
     # create isaac environment
     env = gym.make(args_cli.task, cfg=env_cfg, render_mode="rgb_array" if args_cli.video else None)
+    # make sure the configuration is written (and raise any error of the dumps)
+    for future in dump_futures:
+        future.result()
+    dump_pool.shutdown()
     # wrap for video recording
     if args_cli.video:
         video_kwargs = {
-            "video_folder": os.path.join(log_dir, "videos"),
+            "video_folder": str(log_dir / "videos"),
             "step_trigger": lambda step: step % args_cli.video_interval == 0,
             "video_length": args_cli.video_length,
             "disable_logger": True,
         }
         print("[INFO] Recording videos during training.")
         print_dict(video_kwargs, nesting=4)
-        env = gym.wrappers.RecordVideo(env, **video_kwargs)
+        try:
+            env = NVENCRecordVideo(env, **video_kwargs)
+        except (ImportError, RuntimeError) as e:
+            print(f"[WARN] Falling back to gym.wrappers.RecordVideo: {e}")
+            env = gym.wrappers.RecordVideo(env, **video_kwargs)
     # wrap around environment for stable baselines
-    env = Sb3VecEnvWrapper(env)
+    if args_cli.algo == "sbx_ppo":
+        # only import jax when it is used
+        from sbx import PPO as SBXPPO
+
+        # SBX consumes numpy arrays and builds its networks with flax
+        env = PinnedSb3VecEnvWrapper(env)
+        agent_class = SBXPPO
+        vec_normalize_class = VecNormalize
+        if "policy_kwargs" in agent_cfg:
+            agent_cfg["policy_kwargs"] = sbx_policy_kwargs(agent_cfg["policy_kwargs"])
+    else:
+        # keep observations, rewards and the rollout buffer on the device
+        env = TorchVecEnvWrapper(env)
+        agent_class = GPUPPO
+        vec_normalize_class = GPUVecNormalize
     # set the seed
     env.seed(seed=agent_cfg["seed"])
 
-    if "normalize_input" in agent_cfg:
-        env = VecNormalize(
-            env,
-            training=True,
-            norm_obs="normalize_input" in agent_cfg and agent_cfg.pop("normalize_input"),
-            norm_reward="normalize_value" in agent_cfg and agent_cfg.pop("normalize_value"),
-            clip_obs="clip_obs" in agent_cfg and agent_cfg.pop("clip_obs"),
-            gamma=agent_cfg["gamma"],
-            clip_reward=np.inf,
-        )
+    # normalize environment (if needed)
+    env = build_vecnormalize(env, agent_cfg, vec_normalize_class)
 
     # Check if a model path is provided
-    if args_cli.model_path:
-        model_path = os.path.abspath(args_cli.model_path)
-        if os.path.isfile(model_path):
-            # Load the existing model
-            agent = PPO.load(args_cli.model_path, env=env)
-            print(f"[INFO] Loaded existing model from {args_cli.model_path}")
+    if args_cli.model_path and os.path.isfile(args_cli.model_path):
+        # Load the existing model
+        if agent_class is GPUPPO:
+            agent = load_ppo_mmap(args_cli.model_path, env=env)
+        else:
+            agent = agent_class.load(args_cli.model_path, env=env)
+        print(f"[INFO] Loaded existing model from {args_cli.model_path}")
     else:
+        if args_cli.model_path:
+            print(f"[WARN] No model found at {args_cli.model_path}, training a new agent.")
         # Create a new agent from scratch
-        agent = PPO(policy_arch, env, verbose=1, **agent_cfg)
+        agent = agent_class(policy_arch, env, verbose=1, **agent_cfg)
+    # SBX already jit-compiles its networks
+    if args_cli.compile and args_cli.algo == "sb3_ppo":
+        # compile the forward pass instead of the module, so that the parameter names of saved models stay the same
+        mlp_extractor = agent.policy.mlp_extractor
+        mlp_extractor.forward = torch.compile(mlp_extractor.forward)
 
     # configure the logger
-    new_logger = configure(log_dir, ["stdout", "tensorboard"])
+    new_logger = configure(str(log_dir), ["stdout", "tensorboard"])
     agent.set_logger(new_logger)
 
     # callbacks for agent
-    checkpoint_callback = CheckpointCallback(save_freq=1000, save_path=log_dir, name_prefix="model", verbose=2)
+    checkpoint_callback = AsyncCheckpointCallback(
+        save_freq=1000, save_path=str(log_dir), name_prefix="model", verbose=2
+    )
     # train the agent
     agent.learn(total_timesteps=n_timesteps, callback=checkpoint_callback)
     # save the final model
-    agent.save(os.path.join(log_dir, "model"))
+    agent.save(log_dir / "model")
 
     # close the simulator
     env.close()